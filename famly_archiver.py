@@ -5,20 +5,79 @@ Downloads images and creates a static HTML archive from Famly feed data.
 This is the original combined script. Use famly_downloader.py and famly_generator.py for the split workflow.
 """
 
+import os
 import subprocess
 import sys
-import os
+import traceback
 from pathlib import Path
 
+from famly_common import derive_output_dir, metadata_filename
+from famly_downloader import FamlyDownloader
+from famly_generator import FamlyGenerator
+
+def download_images(json_file, use_subprocess=False):
+    """Run the image download step, returning the metadata file path or None on failure"""
+    if use_subprocess:
+        return _download_images_subprocess(json_file)
+    
+    try:
+        downloader = FamlyDownloader(json_file)
+        try:
+            return downloader.download_all_images()
+        finally:
+            downloader.session.close()
+    except Exception:
+        # Keep the full traceback, the summary line alone hides where it failed
+        traceback.print_exc()
+        return None
+
+def _download_images_subprocess(json_file):
+    """Run famly_downloader.py in its own interpreter and read back the archive directory"""
+    output_dir = None
+    # Run unbuffered so progress lines come through the pipe as they are printed
+    with subprocess.Popen([sys.executable, "-u", "famly_downloader.py", json_file],
+                          stdout=subprocess.PIPE, text=True) as process:
+        for line in process.stdout:
+            if line.startswith("ARCHIVE_DIR="):
+                output_dir = Path(line[len("ARCHIVE_DIR="):].rstrip("\n"))
+            else:
+                print(line, end="")
+    if process.returncode != 0:
+        return None
+    
+    # Fall back to deriving the directory from the filename for older downloaders
+    if output_dir is None:
+        output_dir = derive_output_dir(json_file)
+    return output_dir / metadata_filename()
+
+def generate_html(metadata_file, use_subprocess=False):
+    """Run the HTML generation step, returning True on success"""
+    if use_subprocess:
+        result = subprocess.run([sys.executable, "famly_generator.py", str(metadata_file)])
+        return result.returncode == 0
+    
+    try:
+        FamlyGenerator(metadata_file).create_html_archive()
+    except Exception:
+        traceback.print_exc()
+        return False
+    return True
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python famly_archiver.py <feed_data.json>")
+    args = sys.argv[1:]
+    use_subprocess = '--subprocess' in args
+    if use_subprocess:
+        args.remove('--subprocess')
+    
+    if len(args) != 1:
+        print("Usage: python famly_archiver.py <feed_data.json> [--subprocess]")
         print("This script now runs the split workflow:")
         print("  1. famly_downloader.py - Downloads all images")
         print("  2. famly_generator.py - Generates HTML archive")
+        print("Pass --subprocess to run each step in its own Python interpreter.")
         sys.exit(1)
     
-    json_file = sys.argv[1]
+    json_file = args[0]
     if not os.path.exists(json_file):
         print(f"Error: File {json_file} not found")
         sys.exit(1)
@@ -27,29 +86,18 @@ def main():
     
     # Step 1: Download images
     print("\n📥 Step 1: Downloading images...")
-    result = subprocess.run([sys.executable, "famly_downloader.py", json_file])
-    if result.returncode != 0:
+    metadata_file = download_images(json_file, use_subprocess)
+    if metadata_file is None:
         print("❌ Image download failed")
         sys.exit(1)
     
-    # Step 2: Generate HTML (find metadata.json in the output directory)
-    # Extract output directory from the JSON filename
-    import re
-    match = re.search(r'famly_feed_(\d{4}-\d{2}-\d{2}_\d{2}h\d{2}m)', json_file)
-    if match:
-        timestamp = match.group(1)
-        output_dir = f"famly_archive_{timestamp}"
-    else:
-        output_dir = "famly_archive"
-    
-    metadata_file = Path(output_dir) / "metadata.json"
+    # Step 2: Generate HTML
     if not metadata_file.exists():
         print(f"❌ Metadata file not found: {metadata_file}")
         sys.exit(1)
     
     print("\n🎨 Step 2: Generating HTML archive...")
-    result = subprocess.run([sys.executable, "famly_generator.py", str(metadata_file)])
-    if result.returncode != 0:
+    if not generate_html(metadata_file, use_subprocess):
         print("❌ HTML generation failed")
         sys.exit(1)
     
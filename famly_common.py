@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Famly Common Helpers
+Shared helpers for the Famly downloader and archiver scripts.
+"""
+
+import os
+import re
+from pathlib import Path
+
+# orjson comes with the optional 'fast' extra, callers fall back to json when it is None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Matches the export timestamp in feed filenames like famly_feed_2025-08-29_20h25m.json
+_TIMESTAMP_RE = re.compile(r'famly_feed_(\d{4}-\d{2}-\d{2}_\d{2}h\d{2}m)')
+
+def derive_output_dir(json_file):
+    """Derive the archive directory from the timestamp in a feed filename"""
+    match = _TIMESTAMP_RE.search(str(json_file))
+    if match:
+        return Path(f"famly_archive_{match.group(1)}")
+    return Path("famly_archive")
+
+def metadata_filename():
+    """Name of the metadata file, gzipped unless FAMLY_PLAIN_JSON=1 is set"""
+    if os.environ.get('FAMLY_PLAIN_JSON') == '1':
+        return "metadata.json"
+    return "metadata.json.gz"
@@ -4,27 +4,106 @@ Famly Image Downloader
 Downloads images from Famly feed data and creates a metadata file.
 """
 
+import argparse
+import functools
+import gzip
 import json
 import os
+import random
+import shutil
 import sys
-import requests
-from urllib.parse import urlparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from operator import itemgetter
 from pathlib import Path
-import re
+from typing import Optional
+from urllib.parse import quote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from famly_common import derive_output_dir, metadata_filename, orjson
+
+# Default number of images downloaded concurrently
+DEFAULT_WORKERS = 16
+
+# HTTP status codes worth retrying, anything else (404, 403, ...) fails right away
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Network errors worth retrying, including ones raised while streaming the body
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    ProtocolError,
+    ReadTimeoutError,
+)
+
+def retry_transient(max_retries=3, base=1.0, cap=30.0, jitter=0.5):
+    """Retry a request on transient errors with exponential backoff and jitter"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except (requests.exceptions.HTTPError, *TRANSIENT_ERRORS) as e:
+                    response = getattr(e, 'response', None)
+                    if isinstance(e, requests.exceptions.HTTPError) and (
+                        response is None or response.status_code not in TRANSIENT_STATUS_CODES
+                    ):
+                        raise
+                    if attempt == max_retries:
+                        raise
+                    
+                    # Honor the server's Retry-After when rate limited
+                    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+                    if retry_after.isdigit():
+                        delay = min(cap, int(retry_after))
+                    else:
+                        # Cap after adding jitter so no delay exceeds cap
+                        delay = min(cap, base * 2 ** attempt * (1 + random.uniform(0, jitter)))
+                    time.sleep(delay)
+        return wrapper
+    return decorator
+
+@dataclass(frozen=True)
+class DownloadJob:
+    """An image to download and the id its local file is named after"""
+    image_id: str
+    url: str
+
+@dataclass
+class ProcessedItem:
+    """A feed item with its images resolved to downloaded local files"""
+    # Slots avoid a per-instance __dict__ for the thousands of items in a feed
+    __slots__ = (
+        'feedItemId', 'sender', 'receivers', 'body', 'richTextBody', 'createdDate',
+        'images', 'likes', 'comments', 'embed', 'observation_images',
+    )
+    feedItemId: str
+    sender: dict
+    receivers: list
+    body: str
+    richTextBody: str
+    createdDate: str
+    images: list
+    likes: list
+    comments: list
+    embed: Optional[dict]
+    observation_images: list
 
 class FamlyDownloader:
-    def __init__(self, json_file, output_dir=None):
+    def __init__(self, json_file, output_dir=None, refresh=False, max_workers=DEFAULT_WORKERS):
         self.json_file = json_file
+        self.refresh = refresh
+        self.max_workers = max_workers
         
         # Extract timestamp from filename if not provided
         if output_dir is None:
-            # Look for pattern like famly_feed_2025-08-29_20h25m.json
-            match = re.search(r'famly_feed_(\d{4}-\d{2}-\d{2}_\d{2}h\d{2}m)', json_file)
-            if match:
-                timestamp = match.group(1)
-                output_dir = f"famly_archive_{timestamp}"
-            else:
-                output_dir = "famly_archive"
+            output_dir = derive_output_dir(json_file)
         
         self.output_dir = Path(output_dir)
         self.images_dir = self.output_dir / "images"
@@ -33,26 +112,87 @@ class FamlyDownloader:
         self.output_dir.mkdir(exist_ok=True)
         self.images_dir.mkdir(exist_ok=True)
         
-        # Load feed data
-        with open(json_file, 'r') as f:
-            self.feed_data = json.load(f)
+        # ETags of downloaded images by filename, used for conditional requests on --refresh
+        self.etags_file = self.output_dir / ".etags.json"
+        self.etags = {}
+        if self.etags_file.exists():
+            with open(self.etags_file, 'r', encoding='utf-8') as f:
+                self.etags = json.load(f)
+        
+        # Load feed data, using orjson when available as it parses large feeds much faster
+        if orjson is not None:
+            self.feed_data = orjson.loads(Path(json_file).read_bytes())
+        else:
+            with open(json_file, 'r') as f:
+                self.feed_data = json.load(f)
         
         # Create observation lookup dictionary
-        self.observations = {}
-        if 'observations' in self.feed_data:
-            for obs in self.feed_data['observations']:
-                self.observations[obs['id']] = obs
+        self.observations = {obs['id']: obs for obs in self.feed_data.get('observations', ())}
+        
+        # Share one keep-alive session across all downloads, with a connection
+        # pool large enough for every worker thread. Retries are handled by
+        # retry_transient so they also cover errors while streaming the body.
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip'})
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def _is_cached(self, image_url, filepath):
+        """Check whether an image was already downloaded by a previous run"""
+        if not filepath.exists() or filepath.stat().st_size == 0:
+            return False
+        if not self.refresh:
+            return True
+        if filepath.name in self.etags:
+            # Let _save_to_file revalidate with a conditional GET
+            return False
+        
+        # Compare against the remote size to catch truncated or changed files
+        response = self.session.head(image_url, timeout=30, allow_redirects=True)
+        if not response.ok:
+            return False
+        content_length = response.headers.get('Content-Length')
+        return content_length is None or int(content_length) == filepath.stat().st_size
+    
+    @retry_transient()
+    def _save_to_file(self, image_url, filepath):
+        """Stream an image to disk without buffering the whole body in memory"""
+        # Write to a temporary file first so an interrupted download is never
+        # mistaken for a cached image on the next run
+        part_path = filepath.with_name(filepath.name + '.part')
+        headers = {}
+        etag = self.etags.get(filepath.name)
+        # An empty file must be fetched again, never kept by a 304
+        if etag and filepath.exists() and filepath.stat().st_size > 0:
+            headers['If-None-Match'] = etag
+        
+        try:
+            with self.session.get(image_url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 304:
+                    return
+                response.raise_for_status()
+                response.raw.decode_content = True
+                with open(part_path, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=64 * 1024)
+                if response.headers.get('ETag'):
+                    self.etags[filepath.name] = response.headers['ETag']
+            os.replace(part_path, filepath)
+        except Exception:
+            # Don't leave a partial download behind in the images directory
+            if part_path.exists():
+                part_path.unlink()
+            raise
     
     def download_image(self, image_url, image_id):
         """Download an image and return the local filename"""
         try:
-            # Use the big image URL for better quality
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            # Get file extension from URL
+            # Get file extension from the last segment of the URL path
             parsed_url = urlparse(image_url)
-            path_parts = parsed_url.path.split('.')
+            path_parts = parsed_url.path.rsplit('/', 1)[-1].split('.')
             ext = path_parts[-1] if len(path_parts) > 1 else 'jpg'
             
             # Clean extension (remove query params)
@@ -61,164 +201,222 @@ class FamlyDownloader:
             filename = f"{image_id}.{ext}"
             filepath = self.images_dir / filename
             
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
-            print(f"Downloaded: {filename}")
-            return filename
-            
-        except Exception as e:
-            print(f"Error downloading {image_url}: {e}")
-            return None
-    
-    def download_observation_image(self, image_data):
-        """Download an observation image from GraphQL format"""
-        try:
-            secret = image_data['secret']
-            # Use the exact URL format: prefix/key/WIDTHxHEIGHT/path?expires=EXPIRES
-            width = image_data.get('width', 520)
-            height = image_data.get('height', 1040)
-            
-            # Build URL matching the working format
-            image_url = f"{secret['prefix']}/{secret['key']}/{width}x{height}/{secret['path']}"
-            if secret.get('expires'):
-                # URL encode the expires parameter properly
-                expires = secret['expires'].replace(':', '%3A').replace('+', '%2B')
-                image_url += f"?expires={expires}"
-            
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            
-            # Get file extension from path
-            path_parts = secret['path'].split('.')
-            ext = path_parts[-1] if len(path_parts) > 1 else 'jpg'
-            
-            filename = f"{image_data['id']}.{ext}"
-            filepath = self.images_dir / filename
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            try:
+                if not self._is_cached(image_url, filepath):
+                    self._save_to_file(image_url, filepath)
+            except Exception as e:
+                # Keep the copy on disk when it cannot be revalidated, e.g. once its URL has expired
+                if not (filepath.exists() and filepath.stat().st_size > 0):
+                    raise
+                tqdm.write(f"Could not revalidate {image_url}, keeping existing {filename}: {e}")
             
-            print(f"Downloaded observation image: {filename}")
             return filename
             
         except Exception as e:
-            print(f"Error downloading observation image: {e}")
+            tqdm.write(f"Error downloading {image_url}: {e}")
             return None
     
-    def process_feed_item(self, item, current_index=None, total_items=None):
-        """Process a single feed item and download its images"""
-        progress_info = ""
-        if current_index is not None and total_items is not None:
-            percentage = (current_index / total_items) * 100
-            progress_info = f" [{current_index}/{total_items} - {percentage:.1f}%]"
+    def _observation_image_url(self, image_data):
+        """Build the download URL for an observation image from GraphQL format"""
+        secret = image_data['secret']
+        # Use the exact URL format: prefix/key/WIDTHxHEIGHT/path?expires=EXPIRES
+        width = image_data.get('width', 520)
+        height = image_data.get('height', 1040)
         
-        print(f"Processing feed item: {item.get('feedItemId', 'unknown')}{progress_info}")
-        
-        # Download images
-        local_images = []
-        if 'images' in item:
-            for image in item['images']:
+        # Build URL matching the working format
+        image_url = f"{secret['prefix']}/{secret['key']}/{width}x{height}/{secret['path']}"
+        if secret.get('expires'):
+            # URL encode the expires parameter properly
+            image_url += f"?expires={quote(secret['expires'], safe='')}"
+        return image_url
+    
+    def _embedded_observation(self, item):
+        """Return the observation embedded in a feed item, if any"""
+        embed = item.get('embed')
+        if embed and embed.get('type') == 'Observation':
+            return self.observations.get(embed.get('observationId'))
+        return None
+    
+    def _collect_download_jobs(self, feed_items):
+        """Build one DownloadJob per unique image, plus aliases for repeated observation images"""
+        jobs = {}
+        # Observation images that point at an already seen stored file reuse its download
+        aliases = {}
+        observation_sources = {}
+        for item in feed_items:
+            for image in item.get('images', []):
                 # Use url_big for better quality, fallback to url
                 image_url = image.get('url_big', image.get('url'))
                 if image_url:
-                    local_filename = self.download_image(image_url, image['imageId'])
+                    # The same image can be shared in several posts, only fetch it once
+                    jobs.setdefault(image['imageId'], DownloadJob(image['imageId'], image_url))
+            
+            obs = self._embedded_observation(item)
+            if obs:
+                for obs_image in obs.get('images') or []:
+                    if 'secret' not in obs_image:
+                        continue
+                    secret = obs_image['secret']
+                    source_id = observation_sources.setdefault((secret['key'], secret['path']), obs_image['id'])
+                    if source_id != obs_image['id']:
+                        aliases[obs_image['id']] = source_id
+                    else:
+                        jobs.setdefault(obs_image['id'], DownloadJob(obs_image['id'], self._observation_image_url(obs_image)))
+        return list(jobs.values()), aliases
+    
+    def _download_all_images(self, jobs):
+        """Download images concurrently and return a dict of image_id -> local filename"""
+        downloaded = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.download_image, job.url, job.image_id): job.image_id
+                for job in jobs
+            }
+            with tqdm(total=len(futures), desc="📥 Images", unit="img") as progress:
+                for future in as_completed(futures):
+                    progress.update(1)
+                    local_filename = future.result()
                     if local_filename:
-                        local_images.append({
-                            'filename': local_filename,
-                            'width': image.get('width', 0),
-                            'height': image.get('height', 0),
-                            'createdAt': image.get('createdAt', {}).get('date', ''),
-                            'tags': image.get('tags', [])
-                        })
-        
-        # Check if this is an observation embed and download observation images
+                        downloaded[futures[future]] = local_filename
+        return downloaded
+    
+    def process_feed_item(self, item, downloaded_images):
+        """Process a single feed item using the already downloaded images"""
+        # Look up downloaded images
+        local_images = []
+        if 'images' in item:
+            for image in item['images']:
+                local_filename = downloaded_images.get(image['imageId'])
+                if local_filename:
+                    local_images.append({
+                        'filename': local_filename,
+                        'width': image.get('width', 0),
+                        'height': image.get('height', 0),
+                        'createdAt': image.get('createdAt', {}).get('date', ''),
+                        'tags': image.get('tags', [])
+                    })
+        
+        # Look up downloaded observation images if this is an observation embed
         observation_images = []
-        embed = item.get('embed')
-        if embed and embed.get('type') == 'Observation':
-            observation_id = embed.get('observationId')
-            if observation_id and observation_id in self.observations:
-                obs = self.observations[observation_id]
-                if obs.get('images'):
-                    for obs_image in obs['images']:
-                        local_filename = self.download_observation_image(obs_image)
-                        if local_filename:
-                            observation_images.append({
-                                'filename': local_filename,
-                                'width': obs_image.get('width', 0),
-                                'height': obs_image.get('height', 0),
-                                'id': obs_image['id']
-                            })
-        
-        return {
-            'feedItemId': item.get('feedItemId', ''),
-            'sender': item.get('sender', {}),
-            'receivers': item.get('receivers', []),
-            'body': item.get('body', ''),
-            'richTextBody': item.get('richTextBody', ''),
-            'createdDate': item.get('createdDate', ''),
-            'images': local_images,
-            'likes': item.get('likes', []),
-            'comments': item.get('comments', []),
-            'embed': embed,
-            'observation_images': observation_images
-        }
+        obs = self._embedded_observation(item)
+        if obs and obs.get('images'):
+            for obs_image in obs['images']:
+                local_filename = downloaded_images.get(obs_image['id'])
+                if local_filename:
+                    observation_images.append({
+                        'filename': local_filename,
+                        'width': obs_image.get('width', 0),
+                        'height': obs_image.get('height', 0),
+                        'id': obs_image['id']
+                    })
+        
+        return ProcessedItem(
+            feedItemId=item.get('feedItemId', ''),
+            sender=item.get('sender', {}),
+            receivers=item.get('receivers', []),
+            body=item.get('body', ''),
+            richTextBody=item.get('richTextBody', ''),
+            createdDate=item.get('createdDate', ''),
+            images=local_images,
+            likes=item.get('likes', []),
+            comments=item.get('comments', []),
+            embed=item.get('embed'),
+            observation_images=observation_images,
+        )
+    
+    def _write_metadata(self, metadata_file, metadata):
+        """Write metadata as compact gzipped JSON, or indented JSON for a plain .json file"""
+        # orjson serializes the ProcessedItem dataclasses natively, json needs asdict
+        if metadata_file.suffix == '.gz':
+            if orjson is not None:
+                data = orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS)
+            else:
+                data = json.dumps(metadata, ensure_ascii=False, separators=(',', ':'), default=asdict).encode('utf-8')
+            # Favor speed over ratio, JSON compresses well even at the lowest level
+            with gzip.open(metadata_file, 'wb', compresslevel=1) as f:
+                f.write(data)
+        elif orjson is not None:
+            metadata_file.write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(metadata_file, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, indent=2, ensure_ascii=False, default=asdict)
     
     def download_all_images(self):
-        """Download all images and create metadata file"""
+        """Download all images, create the metadata file and return its path"""
         print(f"🚀 Starting image download from {self.json_file}")
         print(f"📁 Output directory: {self.output_dir}")
         
         feed_items = self.feed_data.get('feedItems', [])
         print(f"📸 Found {len(feed_items)} feed items to process")
         
-        # Sort by date (newest first)
-        feed_items.sort(key=lambda x: x.get('createdDate', ''), reverse=True)
+        # Sort by date (newest first); ISO-8601 dates sort correctly as strings
+        for item in feed_items:
+            item.setdefault('createdDate', '')
+        feed_items.sort(key=itemgetter('createdDate'), reverse=True)
         
-        # Process each feed item
-        processed_items = []
-        total_items = len(feed_items)
-        print(f"\n📋 Starting to download images from {total_items} feed items...")
+        # Download all feed images up front so requests overlap on the network
+        jobs, aliases = self._collect_download_jobs(feed_items)
+        print(f"\n📋 Starting to download {len(jobs)} images using {self.max_workers} workers...")
+        downloaded_images = self._download_all_images(jobs)
+        for image_id, source_id in aliases.items():
+            if source_id in downloaded_images:
+                downloaded_images[image_id] = downloaded_images[source_id]
         
-        for i, item in enumerate(feed_items, 1):
-            processed_item = self.process_feed_item(item, i, total_items)
-            processed_items.append(processed_item)
-            
-            # Show progress every 10 items or at the end
-            if i % 10 == 0 or i == total_items:
-                percentage = (i / total_items) * 100
-                print(f"📊 Progress: {i}/{total_items} items processed ({percentage:.1f}%)")
+        with open(self.etags_file, 'w', encoding='utf-8') as f:
+            json.dump(self.etags, f, indent=2)
+        
+        # Assemble processed items from the downloaded image filenames
+        processed_items = [None] * len(feed_items)
+        for i, item in enumerate(feed_items):
+            processed_items[i] = self.process_feed_item(item, downloaded_images)
+        
+        # Only keep observations that are embedded in a feed item, the rest are never shown
+        referenced_observations = {}
+        for item in feed_items:
+            obs = self._embedded_observation(item)
+            if obs:
+                referenced_observations[obs['id']] = obs
         
         # Save metadata for HTML generation
         metadata = {
             'processed_items': processed_items,
-            'observations': self.observations,
+            'observations': referenced_observations,
             'export_date': self.feed_data.get('exportDate'),
             'total_items': len(processed_items)
         }
         
-        metadata_file = self.output_dir / "metadata.json"
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        metadata_file = self.output_dir / metadata_filename()
+        self._write_metadata(metadata_file, metadata)
         
-        total_photos = sum(len(item['images']) + len(item.get('observation_images', [])) for item in processed_items)
+        total_photos = sum(len(item.images) + len(item.observation_images) for item in processed_items)
         print(f"\n✅ Image download completed!")
         print(f"📁 Location: {self.output_dir.absolute()}")
         print(f"📊 Downloaded: {total_photos} photos from {len(processed_items)} posts")
         print(f"💾 Metadata saved to: {metadata_file}")
+        # Machine readable last line so famly_archiver.py --subprocess finds the archive
+        print(f"ARCHIVE_DIR={self.output_dir}")
+        return metadata_file
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python famly_downloader.py <feed_data.json>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Download images from Famly feed data")
+    parser.add_argument('json_file', help="Feed data JSON captured with famly_capture.js")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Revalidate already downloaded images with the server")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of concurrent downloads (default: {DEFAULT_WORKERS})")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
     
-    json_file = sys.argv[1]
-    if not os.path.exists(json_file):
-        print(f"Error: File {json_file} not found")
+    if not os.path.exists(args.json_file):
+        print(f"Error: File {args.json_file} not found")
         sys.exit(1)
     
-    downloader = FamlyDownloader(json_file)
-    downloader.download_all_images()
+    downloader = FamlyDownloader(args.json_file, refresh=args.refresh, max_workers=args.workers)
+    try:
+        downloader.download_all_images()
+    finally:
+        downloader.session.close()
 
 if __name__ == "__main__":
     main()
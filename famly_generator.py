@@ -4,162 +4,194 @@ Famly HTML Generator
 Generates a static HTML archive from downloaded images and metadata.
 """
 
+import gzip
 import json
 import os
 import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
-import html
+from functools import lru_cache
 from pathlib import Path
+from string import Template
 
-class FamlyGenerator:
-    def __init__(self, metadata_file):
-        self.metadata_file = Path(metadata_file)
-        self.output_dir = self.metadata_file.parent
-        
-        # Load metadata
-        with open(metadata_file, 'r', encoding='utf-8') as f:
-            self.metadata = json.load(f)
-        
-        self.processed_items = self.metadata['processed_items']
-        self.observations = self.metadata.get('observations', {})
-    
-    def format_date(self, date_str):
-        """Format date string for display"""
-        try:
-            # Parse the date from the feed
-            dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            return dt.strftime("%B %d, %Y at %I:%M %p")
-        except:
-            return date_str
-    
-    def generate_html(self):
-        """Generate the HTML archive"""
-        total_photos = sum(len(item['images']) + len(item.get('observation_images', [])) for item in self.processed_items)
-        
-        html_content = f"""<!DOCTYPE html>
+from famly_common import orjson
+
+# Same replacements as html.escape(quote=True), applied in a single pass
+_HTML_ESCAPE_TABLE = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    "'": '&#x27;',
+})
+
+# Plain-text post bodies are escaped and get their line breaks in the same pass
+_BODY_ESCAPE_TABLE = {**_HTML_ESCAPE_TABLE, ord('\n'): '<br>'}
+
+def _escape(text):
+    """Escape text for use in HTML content and attributes"""
+    return text.translate(_HTML_ESCAPE_TABLE)
+
+# Names, receivers and area titles repeat across most items, so memoize those
+_escape_name = lru_cache(maxsize=8192)(_escape)
+
+@lru_cache(maxsize=8192)
+def _format_date(date_str):
+    """Format date string for display"""
+    try:
+        # Parse the date from the feed
+        dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+        return dt.strftime("%B %d, %Y at %I:%M %p")
+    except (AttributeError, ValueError):
+        return date_str
+
+def _images_html(images, alt, indent):
+    """Render an images grid for a list of downloaded images"""
+    containers = ''.join(
+        f'{indent}    <div class="image-container">\n'
+        f'{indent}        <img src="images/{image["filename"]}" alt="{alt}" loading="lazy">\n'
+        f'{indent}    </div>\n'
+        for image in images
+    )
+    return f'{indent}<div class="images-grid">\n{containers}{indent}</div>\n'
+
+def _likes_html(likes):
+    """Render the likes of a feed item"""
+    rendered = ''.join(
+        f'            <div class="like">{like.get("reaction", "❤️")} {_escape_name(like.get("name", "Someone"))}</div>\n'
+        for like in likes
+    )
+    return f'        <div class="likes">\n{rendered}        </div>\n'
+
+# Page scaffolding shared by index.html and posts-only.html
+_HEADER_OPEN_TMPL = Template("""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Famly Feed Archive</title>
+    <title>$title</title>
     <style>
-        body {{
+""")
+
+_CSS = """        body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
             max-width: 800px;
             margin: 0 auto;
             padding: 20px;
             background-color: #f5f5f5;
-        }}
-        .feed-item {{
+        }
+        .feed-item {
             background: white;
             border-radius: 12px;
             margin-bottom: 24px;
             padding: 20px;
             box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }}
-        .sender {{
+        }
+        .sender {
             display: flex;
             align-items: center;
             margin-bottom: 12px;
-        }}
-        .sender-image {{
+        }
+        .sender-image {
             width: 40px;
             height: 40px;
             border-radius: 50%;
             margin-right: 12px;
             background-color: #ddd;
-        }}
-        .sender-info {{
+        }
+        .sender-info {
             flex: 1;
-        }}
-        .sender-name {{
+        }
+        .sender-name {
             font-weight: 600;
             color: #333;
-        }}
-        .post-date {{
+        }
+        .post-date {
             color: #666;
             font-size: 14px;
-        }}
-        .receivers {{
+        }
+        .receivers {
             color: #666;
             font-size: 14px;
             margin-bottom: 12px;
-        }}
-        .post-body {{
+        }
+        .post-body {
             margin-bottom: 16px;
             line-height: 1.5;
-        }}
-        .images-grid {{
+        }
+        .images-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
             gap: 12px;
             margin-bottom: 16px;
-        }}
-        .image-container {{
+        }
+        .image-container {
             position: relative;
-        }}
-        .image-container img {{
+        }
+        .image-container img {
             width: 100%;
             height: auto;
             border-radius: 8px;
             cursor: pointer;
-        }}
-        .likes {{
+        }
+        .likes {
             display: flex;
             align-items: center;
             gap: 8px;
             color: #666;
             font-size: 14px;
-        }}
-        .like {{
+        }
+        .like {
             display: flex;
             align-items: center;
             gap: 4px;
-        }}
-        .archive-header {{
+        }
+        .archive-header {
             text-align: center;
             margin-bottom: 40px;
             padding: 20px;
             background: white;
             border-radius: 12px;
-        }}
-        .stats {{
+        }
+        .stats {
             display: flex;
             justify-content: center;
             gap: 40px;
             margin-top: 16px;
-        }}
-        .stat {{
+        }
+        .stat {
             text-align: center;
-        }}
-        .stat-number {{
+        }
+        .stat-number {
             font-size: 24px;
             font-weight: 600;
             color: #333;
-        }}
-        .stat-label {{
+        }
+        .stat-label {
             color: #666;
             font-size: 14px;
-        }}
-        .observation {{
+        }
+        .observation {
             background: #f8f9fa;
             border-left: 4px solid #007bff;
             padding: 16px;
             margin: 16px 0;
             border-radius: 4px;
-        }}
-        .observation h4 {{
+        }
+        .observation h4 {
             margin: 0 0 12px 0;
             color: #007bff;
-        }}
-        .observation-text {{
+        }
+        .observation-text {
             margin: 12px 0;
             line-height: 1.5;
-        }}
-        .development-areas {{
+        }
+        .development-areas {
             margin: 12px 0;
-        }}
-        .area-tag {{
+        }
+        .area-tag {
             display: inline-block;
             background: #e9ecef;
             padding: 4px 8px;
@@ -167,15 +199,12 @@ class FamlyGenerator:
             border-radius: 12px;
             font-size: 12px;
             color: #495057;
-        }}
-    </style>
-</head>
-<body>
-        .navigation {{
+        }
+        .navigation {
             text-align: center;
             margin-bottom: 20px;
-        }}
-        .nav-link {{
+        }
+        .nav-link {
             display: inline-block;
             padding: 8px 16px;
             margin: 0 8px;
@@ -183,51 +212,41 @@ class FamlyGenerator:
             color: white;
             text-decoration: none;
             border-radius: 6px;
-        }}
-        .nav-link:hover {{
+        }
+        .nav-link:hover {
             background: #0056b3;
-        }}
-        .nav-link.current {{
+        }
+        .nav-link.current {
             background: #28a745;
-        }}
-    </style>
+        }
+"""
+
+_HEAD_TMPL = Template("""    </style>
 </head>
 <body>
     <div class="navigation">
-        <a href="index.html" class="nav-link current">All Posts & Observations</a>
-        <a href="posts-only.html" class="nav-link">Posts Only</a>
+        <a href="index.html" class="$index_link_class">All Posts & Observations</a>
+        <a href="posts-only.html" class="$posts_link_class">Posts Only</a>
     </div>
     
     <div class="archive-header">
-        <h1>Famly Feed Archive</h1>
-        <p>Exported on {datetime.now().strftime("%B %d, %Y")}</p>
+        <h1>$title</h1>
+        <p>Exported on $exported_on</p>
         <div class="stats">
             <div class="stat">
-                <div class="stat-number">{len(self.processed_items)}</div>
-                <div class="stat-label">Total Items</div>
+                <div class="stat-number">$post_count</div>
+                <div class="stat-label">$post_label</div>
             </div>
             <div class="stat">
-                <div class="stat-number">{total_photos}</div>
+                <div class="stat-number">$photo_count</div>
                 <div class="stat-label">Photos</div>
             </div>
         </div>
     </div>
-"""
-        
-        for item in self.processed_items:
-            sender = item['sender']
-            sender_name = html.escape(sender.get('name', 'Unknown'))
-            post_date = self.format_date(item['createdDate'])
-            receivers = ', '.join(item['receivers']) if item['receivers'] else ''
-            
-            # Use richTextBody if available, otherwise use body
-            post_body = item.get('richTextBody', item.get('body', ''))
-            if post_body and not post_body.startswith('<'):
-                post_body = html.escape(post_body).replace('\n', '<br>')
-            elif not post_body:
-                post_body = ''
-            
-            html_content += f"""
+""")
+
+# Filled with str.format_map, each optional block is pre-rendered or empty
+_ITEM_TMPL = """
     <div class="feed-item">
         <div class="sender">
             <div class="sender-image"></div>
@@ -236,329 +255,214 @@ class FamlyGenerator:
                 <div class="post-date">{post_date}</div>
             </div>
         </div>
+{receivers_html}{body_html}{images_html}{observation_html}{likes_html}    </div>
 """
-            
-            if receivers:
-                html_content += f'        <div class="receivers">To: {html.escape(receivers)}</div>\n'
-            
-            if post_body:
-                html_content += f'        <div class="post-body">{post_body}</div>\n'
-            
-            # Handle regular images
-            if item['images']:
-                html_content += '        <div class="images-grid">\n'
-                for image in item['images']:
-                    html_content += f"""            <div class="image-container">
-                <img src="images/{image['filename']}" alt="Photo" loading="lazy">
-            </div>
-"""
-                html_content += '        </div>\n'
-            
-            # Handle observation content
-            embed = item.get('embed')
-            if embed and embed.get('type') == 'Observation':
-                observation_id = embed.get('observationId')
-                if observation_id and observation_id in self.observations:
-                    obs = self.observations[observation_id]
-                    html_content += '        <div class="observation">\n'
-                    html_content += '            <h4>📝 Observation</h4>\n'
-                    
-                    # Observation author
-                    if obs.get('createdBy'):
-                        author = obs['createdBy']['name']['fullName']
-                        html_content += f'            <p><strong>Observer:</strong> {html.escape(author)}</p>\n'
-                    
-                    # Observation remark
-                    if obs.get('remark'):
-                        remark = obs['remark']
-                        remark_body = remark.get('richTextBody', remark.get('body', ''))
-                        if remark_body:
-                            html_content += f'            <div class="observation-text">{remark_body}</div>\n'
-                        
-                        # Development areas
-                        if remark.get('areas'):
-                            html_content += '            <div class="development-areas">\n'
-                            html_content += '                <strong>Development Areas:</strong>\n'
-                            for area in remark['areas']:
-                                area_info = area['area']
-                                refinement = area.get('refinement', '')
-                                html_content += f'                <span class="area-tag">{html.escape(area_info["title"])} ({refinement})</span>\n'
-                            html_content += '            </div>\n'
-                    
-                    # Observation images (already downloaded)
-                    if item.get('observation_images'):
-                        html_content += '            <div class="images-grid">\n'
-                        for obs_image in item['observation_images']:
-                            html_content += f"""                <div class="image-container">
-                    <img src="images/{obs_image['filename']}" alt="Observation Photo" loading="lazy">
-                </div>
-"""
-                        html_content += '            </div>\n'
-                    
-                    html_content += '        </div>\n'
-            
-            if item['likes']:
-                html_content += '        <div class="likes">\n'
-                for like in item['likes']:
-                    reaction = like.get('reaction', '❤️')
-                    name = html.escape(like.get('name', 'Someone'))
-                    html_content += f'            <div class="like">{reaction} {name}</div>\n'
-                html_content += '        </div>\n'
-            
-            html_content += '    </div>\n'
-        
-        html_content += """
+
+_FOOTER = """
 </body>
 </html>"""
+
+def _is_observation(item):
+    """Whether a feed item embeds an observation"""
+    embed = item.get('embed')
+    return bool(embed) and embed.get('type') == 'Observation'
+
+@dataclass(frozen=True)
+class Stats:
+    """Item and photo counts for both archive pages, gathered in one pass"""
+    total_items: int
+    total_photos: int
+    posts_only_items: int
+    posts_only_photos: int
+    posts_indices: array
+
+class FamlyGenerator:
+    def __init__(self, metadata_file):
+        self.metadata_file = Path(metadata_file)
+        self.output_dir = self.metadata_file.parent
+        
+        # Load metadata, which the downloader writes gzipped by default
+        data = self.metadata_file.read_bytes()
+        if self.metadata_file.suffix == '.gz':
+            data = gzip.decompress(data)
+        # Use orjson when available as it parses large archives much faster
+        self.metadata = orjson.loads(data) if orjson is not None else json.loads(data)
+        
+        self.processed_items = self.metadata['processed_items']
+        self.observations = self.metadata.get('observations', {})
+        self._is_obs = [_is_observation(item) for item in self.processed_items]
         
-        return html_content
+        # Stamp both pages with the same export date
+        self._exported_on = datetime.now().strftime("%B %d, %Y")
     
-    def generate_posts_only_html(self):
-        """Generate HTML archive with posts only (no observations)"""
-        # Filter out items that are observations
-        posts_only = [item for item in self.processed_items 
-                     if not (item.get('embed') and item.get('embed', {}).get('type') == 'Observation')]
+    def _compute_stats(self):
+        """Count items and photos for both pages in a single pass over the feed"""
+        total_photos = 0
+        posts_only_photos = 0
+        # Compact uint32 indices of non-observation posts
+        posts_indices = array('I')
         
-        total_photos = sum(len(item['images']) for item in posts_only)
+        for i, (item, is_obs) in enumerate(zip(self.processed_items, self._is_obs)):
+            photos = len(item['images'])
+            total_photos += photos + len(item.get('observation_images', []))
+            if not is_obs:
+                posts_only_photos += photos
+                posts_indices.append(i)
         
-        html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Famly Feed Archive - Posts Only</title>
-    <style>
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            max-width: 800px;
-            margin: 0 auto;
-            padding: 20px;
-            background-color: #f5f5f5;
-        }}
-        .feed-item {{
-            background: white;
-            border-radius: 12px;
-            margin-bottom: 24px;
-            padding: 20px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }}
-        .sender {{
-            display: flex;
-            align-items: center;
-            margin-bottom: 12px;
-        }}
-        .sender-image {{
-            width: 40px;
-            height: 40px;
-            border-radius: 50%;
-            margin-right: 12px;
-            background-color: #ddd;
-        }}
-        .sender-info {{
-            flex: 1;
-        }}
-        .sender-name {{
-            font-weight: 600;
-            color: #333;
-        }}
-        .post-date {{
-            color: #666;
-            font-size: 14px;
-        }}
-        .receivers {{
-            color: #666;
-            font-size: 14px;
-            margin-bottom: 12px;
-        }}
-        .post-body {{
-            margin-bottom: 16px;
-            line-height: 1.5;
-        }}
-        .images-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 12px;
-            margin-bottom: 16px;
-        }}
-        .image-container {{
-            position: relative;
-        }}
-        .image-container img {{
-            width: 100%;
-            height: auto;
-            border-radius: 8px;
-            cursor: pointer;
-        }}
-        .likes {{
-            display: flex;
-            align-items: center;
-            gap: 8px;
-            color: #666;
-            font-size: 14px;
-        }}
-        .like {{
-            display: flex;
-            align-items: center;
-            gap: 4px;
-        }}
-        .archive-header {{
-            text-align: center;
-            margin-bottom: 40px;
-            padding: 20px;
-            background: white;
-            border-radius: 12px;
-        }}
-        .stats {{
-            display: flex;
-            justify-content: center;
-            gap: 40px;
-            margin-top: 16px;
-        }}
-        .stat {{
-            text-align: center;
-        }}
-        .stat-number {{
-            font-size: 24px;
-            font-weight: 600;
-            color: #333;
-        }}
-        .stat-label {{
-            color: #666;
-            font-size: 14px;
-        }}
-        .navigation {{
-            text-align: center;
-            margin-bottom: 20px;
-        }}
-        .nav-link {{
-            display: inline-block;
-            padding: 8px 16px;
-            margin: 0 8px;
-            background: #007bff;
-            color: white;
-            text-decoration: none;
-            border-radius: 6px;
-        }}
-        .nav-link:hover {{
-            background: #0056b3;
-        }}
-        .nav-link.current {{
-            background: #28a745;
-        }}
-    </style>
-</head>
-<body>
-    <div class="navigation">
-        <a href="index.html" class="nav-link">All Posts & Observations</a>
-        <a href="posts-only.html" class="nav-link current">Posts Only</a>
-    </div>
+        return Stats(
+            total_items=len(self.processed_items),
+            total_photos=total_photos,
+            posts_only_items=len(posts_indices),
+            posts_only_photos=posts_only_photos,
+            posts_indices=posts_indices,
+        )
     
-    <div class="archive-header">
-        <h1>Famly Feed Archive - Posts Only</h1>
-        <p>Exported on {datetime.now().strftime("%B %d, %Y")}</p>
-        <div class="stats">
-            <div class="stat">
-                <div class="stat-number">{len(posts_only)}</div>
-                <div class="stat-label">Posts</div>
-            </div>
-            <div class="stat">
-                <div class="stat-number">{total_photos}</div>
-                <div class="stat-label">Photos</div>
-            </div>
-        </div>
-    </div>
-"""
+    def _observation_html(self, item):
+        """Render the observation embedded in an observation feed item, or an empty string"""
+        obs = self.observations.get(item['embed'].get('observationId'))
+        if not obs:
+            return ''
         
-        for item in posts_only:
-            sender = item['sender']
-            sender_name = html.escape(sender.get('name', 'Unknown'))
-            post_date = self.format_date(item['createdDate'])
-            receivers = ', '.join(item['receivers']) if item['receivers'] else ''
-            
-            # Use richTextBody if available, otherwise use body
-            post_body = item.get('richTextBody', item.get('body', ''))
-            if post_body and not post_body.startswith('<'):
-                post_body = html.escape(post_body).replace('\n', '<br>')
-            elif not post_body:
-                post_body = ''
-            
-            html_content += f"""
-    <div class="feed-item">
-        <div class="sender">
-            <div class="sender-image"></div>
-            <div class="sender-info">
-                <div class="sender-name">{sender_name}</div>
-                <div class="post-date">{post_date}</div>
-            </div>
-        </div>
-"""
-            
-            if receivers:
-                html_content += f'        <div class="receivers">To: {html.escape(receivers)}</div>\n'
-            
-            if post_body:
-                html_content += f'        <div class="post-body">{post_body}</div>\n'
-            
-            # Handle regular images only
-            if item['images']:
-                html_content += '        <div class="images-grid">\n'
-                for image in item['images']:
-                    html_content += f"""            <div class="image-container">
-                <img src="images/{image['filename']}" alt="Photo" loading="lazy">
-            </div>
-"""
-                html_content += '        </div>\n'
-            
-            if item['likes']:
-                html_content += '        <div class="likes">\n'
-                for like in item['likes']:
-                    reaction = like.get('reaction', '❤️')
-                    name = html.escape(like.get('name', 'Someone'))
-                    html_content += f'            <div class="like">{reaction} {name}</div>\n'
-                html_content += '        </div>\n'
+        parts = ['        <div class="observation">\n', '            <h4>📝 Observation</h4>\n']
+        
+        # Observation author
+        if obs.get('createdBy'):
+            author = obs['createdBy']['name']['fullName']
+            parts.append(f'            <p><strong>Observer:</strong> {_escape_name(author)}</p>\n')
+        
+        # Observation remark
+        if obs.get('remark'):
+            remark = obs['remark']
+            remark_body = remark.get('richTextBody', remark.get('body', ''))
+            if remark_body:
+                parts.append(f'            <div class="observation-text">{remark_body}</div>\n')
             
-            html_content += '    </div>\n'
+            # Development areas
+            if remark.get('areas'):
+                areas_html = ''.join(
+                    f'                <span class="area-tag">{_escape_name(area["area"]["title"])} ({area.get("refinement", "")})</span>\n'
+                    for area in remark['areas']
+                )
+                parts.append(
+                    '            <div class="development-areas">\n'
+                    '                <strong>Development Areas:</strong>\n'
+                    f'{areas_html}            </div>\n'
+                )
         
-        html_content += """
-</body>
-</html>"""
+        # Observation images (already downloaded)
+        if item.get('observation_images'):
+            parts.append(_images_html(item['observation_images'], 'Observation Photo', '            '))
+        
+        parts.append('        </div>\n')
+        return ''.join(parts)
+    
+    def _render_item(self, item, include_observations):
+        """Render one feed item, with its embedded observation when requested"""
+        sender_name = _escape_name(item['sender'].get('name', 'Unknown'))
+        post_date = _format_date(item['createdDate'])
+        receivers = ', '.join(item['receivers']) if item['receivers'] else ''
+        
+        # Use richTextBody if available, otherwise use body
+        post_body = item.get('richTextBody', item.get('body', ''))
+        if post_body and not post_body.startswith('<'):
+            post_body = post_body.translate(_BODY_ESCAPE_TABLE)
+        
+        # Render each optional block up front, then fill the item template in one call
+        return _ITEM_TMPL.format_map({
+            'sender_name': sender_name,
+            'post_date': post_date,
+            'receivers_html': f'        <div class="receivers">To: {_escape_name(receivers)}</div>\n' if receivers else '',
+            'body_html': f'        <div class="post-body">{post_body}</div>\n' if post_body else '',
+            'images_html': _images_html(item['images'], 'Photo', '        ') if item['images'] else '',
+            'observation_html': self._observation_html(item) if include_observations else '',
+            'likes_html': _likes_html(item['likes']) if item['likes'] else '',
+        })
+    
+    def _iter_page(self, title, current, post_count, post_label, photo_count, items):
+        """Yield a page fragment by fragment from (item, include_observations) pairs"""
+        yield _HEADER_OPEN_TMPL.substitute(title=title)
+        yield _CSS
+        yield _HEAD_TMPL.substitute(
+            title=title,
+            index_link_class="nav-link current" if current == 'index' else "nav-link",
+            posts_link_class="nav-link current" if current == 'posts_only' else "nav-link",
+            exported_on=self._exported_on,
+            post_count=post_count,
+            post_label=post_label,
+            photo_count=photo_count,
+        )
+        
+        render_item = self._render_item
+        for item, include_observations in items:
+            yield render_item(item, include_observations)
         
-        return html_content
+        yield _FOOTER
+    
+    def generate_html(self, stats=None):
+        """Generate the HTML archive"""
+        return ''.join(self.iter_html(stats))
+    
+    def iter_html(self, stats=None):
+        """Yield the HTML archive fragment by fragment"""
+        if stats is None:
+            stats = self._compute_stats()
+        return self._iter_page("Famly Feed Archive", 'index', stats.total_items, "Total Items",
+                               stats.total_photos, zip(self.processed_items, self._is_obs))
+    
+    def generate_posts_only_html(self, stats=None):
+        """Generate HTML archive with posts only (no observations)"""
+        return ''.join(self.iter_posts_only_html(stats))
+    
+    def iter_posts_only_html(self, stats=None):
+        """Yield the posts-only HTML archive fragment by fragment"""
+        if stats is None:
+            stats = self._compute_stats()
+        # Observations were filtered out while computing the stats
+        processed_items = self.processed_items
+        items = ((processed_items[i], False) for i in stats.posts_indices)
+        return self._iter_page("Famly Feed Archive - Posts Only", 'posts_only', stats.posts_only_items, "Posts",
+                               stats.posts_only_photos, items)
 
+    @staticmethod
+    def _write_page(path, fragments):
+        """Write a page to disk, streaming fragments as they are generated"""
+        # Encode each fragment once and write bytes, bypassing the text layer's per-write overhead
+        with open(path, 'wb', buffering=1024 * 1024) as f:
+            f.writelines(fragment.encode('utf-8') for fragment in fragments)
+            
+            # The page is read by a browser later, not by us, so hint that the kernel may drop it from
+            # the page cache. Best effort only: pages still being written back stay cached
+            if hasattr(os, 'posix_fadvise'):
+                f.flush()
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    
     def create_html_archive(self):
         """Create the HTML archive"""
         print(f"🎨 Generating HTML archive from {self.metadata_file}")
         print(f"📁 Output directory: {self.output_dir}")
         
-        # Generate main HTML with all content
-        html_content = self.generate_html()
+        stats = self._compute_stats()
         
-        # Write main HTML file
+        # The two pages are independent, so write them side by side
         html_file = self.output_dir / "index.html"
-        with open(html_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        # Generate posts-only HTML
-        posts_html_content = self.generate_posts_only_html()
-        
-        # Write posts-only HTML file
         posts_html_file = self.output_dir / "posts-only.html"
-        with open(posts_html_file, 'w', encoding='utf-8') as f:
-            f.write(posts_html_content)
-        
-        total_photos = sum(len(item['images']) + len(item.get('observation_images', [])) for item in self.processed_items)
-        posts_only_count = len([item for item in self.processed_items 
-                               if not (item.get('embed') and item.get('embed', {}).get('type') == 'Observation')])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(self._write_page, html_file, self.iter_html(stats)),
+                executor.submit(self._write_page, posts_html_file, self.iter_posts_only_html(stats)),
+            ]
+            for future in futures:
+                future.result()
         
         print(f"\n✅ HTML archive created successfully!")
         print(f"📁 Location: {self.output_dir.absolute()}")
         print(f"🌐 Main archive: {html_file.absolute()}")
         print(f"📝 Posts only: {posts_html_file.absolute()}")
-        print(f"📊 Final stats: {len(self.processed_items)} total items ({posts_only_count} posts, {len(self.processed_items) - posts_only_count} observations), {total_photos} photos archived")
+        print(f"📊 Final stats: {stats.total_items} total items ({stats.posts_only_items} posts, {stats.total_items - stats.posts_only_items} observations), {stats.total_photos} photos archived")
 
 def main():
     if len(sys.argv) != 2:
-        print("Usage: python famly_generator.py <metadata.json>")
+        print("Usage: python famly_generator.py <metadata.json.gz>")
         sys.exit(1)
     
     metadata_file = sys.argv[1]